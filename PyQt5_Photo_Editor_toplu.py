@@ -8,32 +8,142 @@ Controls on the right operate on the currently active tab.
 import sys
 import os
 import math
-from functools import partial
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial, lru_cache
 from PIL import Image, ImageOps, ImageEnhance, ImageFilter
 import numpy as np
 import cv2
 
 from PyQt5.QtGui import QPixmap, QImage, QPainter
-from PyQt5.QtCore import Qt, QByteArray
+from PyQt5.QtCore import (
+    Qt, QByteArray, QTimer, QThreadPool, QRunnable, QObject, pyqtSignal
+)
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QFileDialog, QLabel, QPushButton,
     QHBoxLayout, QVBoxLayout, QGridLayout, QSlider, QSplitter, QSizePolicy,
     QMessageBox, QGraphicsScene, QGraphicsView, QGraphicsPixmapItem,
-    QListWidget, QListWidgetItem, QTabWidget, QAction
+    QListWidget, QListWidgetItem, QTabWidget, QAction, QProgressDialog
 )
 
 # Matplotlib for histogram rendering
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 from matplotlib.figure import Figure
 
+# Detect an OpenCV CUDA device once; denoising falls back to the CPU path
+try:
+    HAS_CUDA = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except Exception:
+    HAS_CUDA = False
+
+def bilateral_filter(a, d, sigma_color, sigma_space):
+    # full-frame bilateral is the dominant cost of noise/portrait; run it on
+    # the GPU when available
+    if HAS_CUDA:
+        gm = cv2.cuda_GpuMat()
+        gm.upload(a)
+        return cv2.cuda.bilateralFilter(gm, d, sigma_color, sigma_space).download()
+    return cv2.bilateralFilter(a, d=d, sigmaColor=sigma_color, sigmaSpace=sigma_space)
+
+# Numba is optional: the preview falls back to NumPy when it is missing
+try:
+    from numba import njit, prange, types
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# ---------------------- Fused preview kernel ----------------------
+if HAS_NUMBA:
+    @njit(fastmath=True, cache=True)
+    def _tone_scalar(t, shad, high):
+        # same curve as the old tone_pixel, per scalar in [0,1]
+        if shad != 0.0:
+            lift = shad * 0.6
+            w = min(1.0, max(0.0, t / 0.6))
+            t = t + (lift * (1.0 - w)) * (1.0 - t)
+        if high != 0.0:
+            comp = high * 0.6
+            w2 = min(1.0, max(0.0, (t - 0.4) / 0.6))
+            t = t - (comp * w2) * t
+        return t
+
+    TILE_ROWS = 64  # strip height: src+dst rows of a strip stay L2-resident
+
+    @njit(fastmath=True, cache=True)
+    def _adjust_strip(src, grq, ggq, gbq, bright, cq, satq, shad, high, vig, dst, y0, y1):
+        # one strip of the fused pass: white balance + brightness + contrast
+        # + saturation + shadows/highlights + vignette, all in registers per
+        # pixel. The affine steps run in Q8 integer fixed point (grq/cq/satq
+        # are the float parameters scaled by 256); only the non-linear tone
+        # curve and the radial falloff stay in float.
+        H, W = src.shape[0], src.shape[1]
+        for y in range(y0, y1):
+            for x in range(W):
+                # affine stages run unclamped with one clamp at the end,
+                # matching the fused cv2.transform path exactly so switching
+                # backends mid-drag causes no visible jump
+                r = (np.int32(src[y, x, 0]) * grq >> 8) + bright
+                g = (np.int32(src[y, x, 1]) * ggq >> 8) + bright
+                b = (np.int32(src[y, x, 2]) * gbq >> 8) + bright
+                r = ((r - 128) * cq >> 8) + 128
+                g = ((g - 128) * cq >> 8) + 128
+                b = ((b - 128) * cq >> 8) + 128
+                if satq != 0:
+                    lum = (54 * r + 183 * g + 18 * b) >> 8
+                    r = lum + ((r - lum) * (256 + satq) >> 8)
+                    g = lum + ((g - lum) * (256 + satq) >> 8)
+                    b = lum + ((b - lum) * (256 + satq) >> 8)
+                r = min(255, max(0, r))
+                g = min(255, max(0, g))
+                b = min(255, max(0, b))
+                if shad != 0.0 or high != 0.0:
+                    r = np.int32(min(255.0, max(0.0, _tone_scalar(r / 255.0, shad, high) * 255.0)))
+                    g = np.int32(min(255.0, max(0.0, _tone_scalar(g / 255.0, shad, high) * 255.0)))
+                    b = np.int32(min(255.0, max(0.0, _tone_scalar(b / 255.0, shad, high) * 255.0)))
+                if vig != 0.0:
+                    # radial falloff computed inline: no meshgrid transients
+                    fx = (2.0 * x - W) / W
+                    fy = (2.0 * y - H) / H
+                    d = math.sqrt(fx * fx + fy * fy) * 0.7071067811865476
+                    m = 1.0 - vig + vig * (0.6 + 0.4 * max(0.0, 1.0 - d))
+                    r = np.int32(r * m)
+                    g = np.int32(g * m)
+                    b = np.int32(b * m)
+                dst[y, x, 0] = np.uint8(r)
+                dst[y, x, 1] = np.uint8(g)
+                dst[y, x, 2] = np.uint8(b)
+
+    # explicit signature: compiled eagerly at import (and cached to disk via
+    # cache=True) so the first slider drag never pays JIT latency. src must
+    # be declared readonly — Pillow exports a read-only buffer, and string
+    # signatures cannot express that — and dst is A-layout because previews
+    # pass a strided view into the RGBA buffer.
+    _adjust_sig = types.void(
+        types.Array(types.uint8, 3, 'C', readonly=True),
+        types.int32, types.int32, types.int32, types.int32, types.int32,
+        types.int32, types.float32, types.float32, types.float32,
+        types.Array(types.uint8, 3, 'A'),
+    )
+
+    @njit(_adjust_sig, parallel=True, cache=True)
+    def _apply_adjust(src, grq, ggq, gbq, bright, cq, satq, shad, high, vig, dst):
+        # cache-friendly tiling: each worker owns whole 64-row strips
+        H = src.shape[0]
+        n_tiles = (H + TILE_ROWS - 1) // TILE_ROWS
+        for ti in prange(n_tiles):
+            y0 = ti * TILE_ROWS
+            y1 = min(y0 + TILE_ROWS, H)
+            _adjust_strip(src, grq, ggq, gbq, bright, cq, satq, shad, high, vig, dst, y0, y1)
+
 # ---------------------- Utilities ----------------------
-def pil_to_qpixmap(im: Image.Image) -> QPixmap:
-    if im.mode != 'RGBA':
-        im = im.convert('RGBA')
-    data = im.tobytes('raw', 'RGBA')
-    qimg = QImage(data, im.width, im.height, QImage.Format_RGBA8888)
+def np_to_qpixmap(arr: np.ndarray) -> QPixmap:
+    # arr is H×W×4 uint8 RGBA; QImage wraps the buffer without copying, so the
+    # caller must keep arr alive (the document owns it, see ImageDocument.rgba)
+    qimg = QImage(arr.data, arr.shape[1], arr.shape[0], arr.strides[0], QImage.Format_RGBA8888)
     return QPixmap.fromImage(qimg)
 
+@lru_cache(maxsize=64)
 def kelvin_to_rgb_gains(kelvin: int):
     temp = kelvin / 100.0
     def clamp(v, lo=0, hi=255):
@@ -57,60 +167,408 @@ def kelvin_to_rgb_gains(kelvin: int):
         b = clamp(b)
     return (r/255.0, g/255.0, b/255.0)
 
+def _build_adjust_lut(gains, bright, contrast):
+    # 256-entry per-channel LUT covering white balance + brightness +
+    # contrast; unclamped until the end, like the other affine backends
+    x = np.arange(256, dtype=np.float32)
+    chans = []
+    for gain in gains:
+        y = (x * gain + bright - 128.0) * contrast + 128.0
+        chans.append(np.clip(y, 0, 255).astype(np.uint8))
+    return np.stack(chans, axis=-1).reshape(1, 256, 3)
+
+def _build_tone_lut(shad, high):
+    # the shadows/highlights curve is position-independent: evaluate it once
+    # over 0..255 instead of per pixel (same formula as _tone_scalar)
+    t = np.arange(256, dtype=np.float32) / 255.0
+    if shad != 0:
+        lift = shad / 100.0 * 0.6
+        w = np.clip(t / 0.6, 0, 1)
+        t = t + (lift * (1 - w)) * (1 - t)
+    if high != 0:
+        comp = high / 100.0 * 0.6
+        w2 = np.clip((t - 0.4) / 0.6, 0, 1)
+        t = t - (comp * w2) * t
+    return np.clip(t * 255.0, 0, 255).astype(np.uint8)
+
+def _compose_matrix(ad):
+    """Fold white balance, brightness, contrast and saturation into one
+    3x4 affine (3x3 matrix + bias column) for cv2.transform.
+
+    Saturation mixes toward luma, contrast scales around 128 and
+    brightness/WB are scale+offset — all linear in RGB, so they compose
+    into a single matrix product.
+    """
+    gains = kelvin_to_rgb_gains(ad['kelvin'])
+    c = 1 + ad['contrast'] / 100.0
+    s = ad['saturation'] / 100.0
+    lw = np.array([0.2126, 0.7152, 0.0722])
+    m_sat = (1 + s) * np.eye(3) - s * np.outer(np.ones(3), lw)
+    m = m_sat @ (c * np.diag(gains))
+    # luma weights sum to 1, so m_sat maps a grey offset to itself
+    bias = (c * ad['brightness'] + 128.0 * (1 - c)) * np.ones(3)
+    return np.hstack([m, bias[:, None]]).astype(np.float32)
+
+def apply_adjustments(src, ad, dst=None):
+    """Render the slider adjustments on an H×W×3 uint8 array.
+
+    Picks the cheapest capable backend: a composite per-channel cv2.LUT
+    whenever saturation is zero (the tone curve folds into the LUT), the
+    fused affine cv2.transform when saturation joins in without the tone
+    curve, the Numba kernel for the rest, and a NumPy fallback without
+    Numba. When dst is given the result is written there (it may be a
+    view into a document's RGBA buffer); the rendered array is returned.
+    """
+    gains = kelvin_to_rgb_gains(ad['kelvin'])
+    c = 1 + (ad['contrast'] / 100.0)
+    vig = ad.get('vignette', 0) / 100.0
+    if vig == 0:
+        # position-independent fast paths only apply without vignette
+        if ad['saturation'] == 0:
+            # without saturation nothing mixes channels: everything is a pure
+            # per-channel function of the input, i.e. one composite LUT sweep
+            lut = _build_adjust_lut(gains, ad['brightness'], c)
+            if ad['shadows'] != 0 or ad['highlights'] != 0:
+                lut = _build_tone_lut(ad['shadows'], ad['highlights'])[lut]
+            out = cv2.LUT(src, lut)
+            if dst is None:
+                return out
+            dst[:, :, :] = out
+            return dst
+        if ad['shadows'] == 0 and ad['highlights'] == 0:
+            out = cv2.transform(src, _compose_matrix(ad))
+            if dst is None:
+                return out
+            dst[:, :, :] = out
+            return dst
+    if HAS_NUMBA:
+        if dst is None:
+            dst = np.empty_like(src)
+        _apply_adjust(src,
+                      np.int32(round(gains[0] * 256)),
+                      np.int32(round(gains[1] * 256)),
+                      np.int32(round(gains[2] * 256)),
+                      np.int32(ad['brightness']),
+                      np.int32(round(c * 256)),
+                      np.int32(round(ad['saturation'] * 256 / 100.0)),
+                      np.float32(ad['shadows'] / 100.0),
+                      np.float32(ad['highlights'] / 100.0),
+                      np.float32(vig),
+                      dst)
+        return dst
+    arr = src.astype(np.float32)
+    # affine stages stay unclamped until after saturation, matching the
+    # single trailing saturate of the cv2.transform/LUT/kernel backends
+    # white balance: one broadcasted multiply instead of three channel passes
+    arr *= np.array(gains, dtype=np.float32).reshape(1, 1, 3)
+    # brightness
+    arr += ad['brightness']
+    # contrast
+    arr = (arr - 128) * c + 128
+    # saturation
+    if ad['saturation'] != 0:
+        s = ad['saturation'] / 100.0
+        lum = (0.2126*arr[:,:,0] + 0.7152*arr[:,:,1] + 0.0722*arr[:,:,2])[:,:,None]
+        arr = lum + (arr - lum) * (1 + s)
+    np.clip(arr, 0, 255, out=arr)
+    # shadows/highlights approx
+    def tone_pixel(a, shadows, highlights):
+        t = a/255.0
+        s = shadows/100.0
+        h = highlights/100.0
+        if s != 0:
+            lift = s*0.6
+            w = np.minimum(1.0, np.maximum(0.0, (t - 0.0)/(0.6-0.0)))
+            t = t + (lift*(1-w))*(1-t)
+        if h != 0:
+            comp = h*0.6
+            w2 = np.minimum(1.0, np.maximum(0.0, (t - 0.4)/(1.0-0.4)))
+            t = t - (comp * w2) * t
+        return np.clip(t*255.0, 0, 255)
+    arr = tone_pixel(arr, ad['shadows'], ad['highlights'])
+    # vignette, blended by strength; same radial falloff as the kernel
+    if vig != 0:
+        mask = _radial_mask(arr.shape[1], arr.shape[0])
+        arr *= (1.0 - vig) + vig * mask[:, :, None]
+    out = arr.astype(np.uint8)
+    if dst is None:
+        return out
+    dst[:, :, :] = out
+    return dst
+
+# vignette falloff masks in Q16 fixed point, keyed by image size
+_VIGNETTE_CACHE = {}
+
+def _vignette_mask(w, h):
+    mask = _VIGNETTE_CACHE.get((w, h))
+    if mask is None:
+        # separable radial falloff: two O(W+H) Gaussian kernels and an outer
+        # product, instead of float64 meshgrids + sqrt over the whole frame
+        kx = cv2.getGaussianKernel(w, w*0.6)
+        ky = cv2.getGaussianKernel(h, h*0.6)
+        m = ky @ kx.T
+        m /= m.max()
+        mask = ((0.6 + 0.4*m) * 65535).astype(np.uint16)
+        _VIGNETTE_CACHE[(w, h)] = mask
+    return mask
+
+# float radial masks matching the kernel's inline vignette falloff, used by
+# the NumPy fallback of the live vignette slider
+_RADIAL_CACHE = {}
+
+def _radial_mask(w, h):
+    mask = _RADIAL_CACHE.get((w, h))
+    if mask is None:
+        fx = (2.0 * np.arange(w, dtype=np.float32) - w) / w
+        fy = (2.0 * np.arange(h, dtype=np.float32) - h) / h
+        d = np.sqrt(fx[None, :]**2 + fy[:, None]**2) * 0.7071067811865476
+        mask = (0.6 + 0.4 * np.maximum(0.0, 1.0 - d)).astype(np.float32)
+        _RADIAL_CACHE[(w, h)] = mask
+    return mask
+
+# Rec.709 luma weights in Q8 fixed point (54+183+18 = 255 -> >>8 stays in uint8)
+_LUMA_Q8 = np.array([54, 183, 18], dtype=np.uint16)
+
 def compute_histogram(pil_img: Image.Image):
     im = pil_img.convert('RGB')
-    arr = np.array(im)
-    r = arr[:,:,0].ravel()
-    g = arr[:,:,1].ravel()
-    b = arr[:,:,2].ravel()
-    lum = (0.2126*r + 0.7152*g + 0.0722*b).astype(np.uint8).ravel()
-    bins = 256
-    hr = np.bincount(r, minlength=bins)
-    hg = np.bincount(g, minlength=bins)
-    hb = np.bincount(b, minlength=bins)
-    hl = np.bincount(lum, minlength=bins)
+    arr = np.asarray(im)
+    hr = cv2.calcHist([arr], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+    hg = cv2.calcHist([arr], [1], None, [256], [0, 256]).ravel().astype(np.int64)
+    hb = cv2.calcHist([arr], [2], None, [256], [0, 256]).ravel().astype(np.int64)
+    lum8 = ((arr @ _LUMA_Q8) >> 8).astype(np.uint8)
+    hl = cv2.calcHist([lum8], [0], None, [256], [0, 256]).ravel().astype(np.int64)
     return {'r': hr, 'g': hg, 'b': hb, 'lum': hl, 'total': im.width*im.height}
 
-def histogram_pixmap(hist, w=400, h=120):
-    fig = Figure(figsize=(w/100.0, h/100.0), dpi=100, tight_layout=True)
-    canvas = FigureCanvas(fig)
-    ax = fig.add_subplot(111)
-    ax.plot(hist['lum'], color='k', linewidth=1.2)
-    ax.plot(hist['r'], color='#c00', linewidth=0.8)
-    ax.plot(hist['g'], color='#0a0', linewidth=0.8)
-    ax.plot(hist['b'], color='#00c', linewidth=0.8)
-    ax.axis('off')
-    canvas.draw()
-    buf = canvas.buffer_rgba()
-    w_px, h_px = int(fig.get_size_inches()[0]*fig.get_dpi()), int(fig.get_size_inches()[1]*fig.get_dpi())
-    arr = np.frombuffer(buf, dtype=np.uint8).reshape((h_px, w_px, 4))
-    img = Image.fromarray(arr)
-    return pil_to_qpixmap(img)
+# ---------------------- Effect implementations ----------------------
+# module-level so export can replay committed operations at full resolution
+def apply_effect_image(img, effect):
+    if effect == 'sharpen':
+        return img.filter(ImageFilter.UnsharpMask(radius=1, percent=120, threshold=3))
+    elif effect in ('orange', 'red', 'blue'):
+        # saturating uint8 add in one C pass, no band split/merge
+        tints = {'orange': (12, 6, 0, 0), 'red': (18, 0, 0, 0), 'blue': (0, 0, 18, 0)}
+        arr = cv2.add(np.asarray(img), tints[effect])
+        return Image.fromarray(arr)
+    elif effect == 'brighten':
+        return ImageEnhance.Brightness(img).enhance(1.15)
+    elif effect == 'clarity':
+        return ImageEnhance.Sharpness(img).enhance(1.2)
+    elif effect == 'vignette':
+        w, h = img.size
+        mask = _vignette_mask(w, h)
+        # integer multiply in Q16, no float32 copy of the frame
+        arr = (np.asarray(img).astype(np.uint32) * mask[:,:,None]) >> 16
+        return Image.fromarray(arr.astype(np.uint8))
+    elif effect == 'noise':
+        a = np.array(img)
+        a = bilateral_filter(a, 5, 75, 75)
+        return Image.fromarray(a)
+    return None
+
+def portrait_image(img):
+    a = np.array(img)
+    gray = cv2.cvtColor(a, cv2.COLOR_RGB2GRAY)
+    faces = []
+    try:
+        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+    except Exception:
+        faces = []
+    arr = a.astype(np.float32)
+    arr[:,:,0] *= 0.95
+    arr[:,:,1] = np.minimum(255, arr[:,:,1]*1.05)
+    arr[:,:,2] = np.minimum(255, arr[:,:,2]*1.05)
+    a = arr.astype(np.uint8)
+    if len(faces) > 0:
+        # face ROIs are small; the CPU filter is fine here
+        for (x,y,w,h) in faces:
+            roi = a[y:y+h, x:x+w]
+            blurred = cv2.bilateralFilter(roi, d=9, sigmaColor=75, sigmaSpace=75)
+            a[y:y+h, x:x+w] = cv2.addWeighted(roi, 0.6, blurred, 0.4, 0)
+    else:
+        a = bilateral_filter(a, 9, 75, 75)
+    return Image.fromarray(a)
+
+def auto_enhance_image(img):
+    img = ImageEnhance.Contrast(img).enhance(1.08)
+    return ImageEnhance.Brightness(img).enhance(1.06)
+
+def _has_adjustments(ad):
+    return any(ad[k] != (6500 if k == 'kelvin' else 0) for k in ad)
+
+def replay_op(img, op):
+    # ops are ('adjust', dict), ('effect', name) or a single-tag tuple,
+    # see ImageDocument.ops
+    kind = op[0]
+    if kind == 'adjust':
+        return Image.fromarray(apply_adjustments(np.asarray(img.convert('RGB')), op[1]))
+    if kind == 'effect':
+        return apply_effect_image(img, op[1]) or img
+    if kind == 'rotate90':
+        return img.rotate(-90, expand=True)
+    if kind == 'flip_h':
+        return ImageOps.mirror(img)
+    if kind == 'portrait':
+        return portrait_image(img)
+    if kind == 'auto':
+        return auto_enhance_image(img)
+    return img
+
+# ---------------------- Histogram worker ----------------------
+class _HistSignals(QObject):
+    done = pyqtSignal(int, dict)
+
+class HistWorker(QRunnable):
+    """Runs compute_histogram off the GUI thread.
+
+    Holds the PIL image by reference; previews replace doc.pil rather than
+    mutating it in place, so the read here is race-free.
+    """
+    def __init__(self, generation, pil_img, signals):
+        super().__init__()
+        self.generation = generation
+        self.pil_img = pil_img
+        self.signals = signals
+
+    def run(self):
+        hist = compute_histogram(self.pil_img)
+        self.signals.done.emit(self.generation, hist)
+
+# ---------------------- Export worker ----------------------
+# top-level so ProcessPoolExecutor can pickle it. Downsampled documents are
+# passed as (path, steps, adjustments): the worker re-opens the original and
+# does the whole full-res replay + encode + write itself, so nothing heavy is
+# staged on the GUI thread. Small documents pass cheap raw RGB bytes.
+def _export_one(args):
+    src, steps, ad, dst = args
+    if isinstance(src, str):
+        img = Image.open(src).convert('RGB')
+        for step in steps:
+            for op in step:
+                img = replay_op(img, op)
+        if _has_adjustments(ad):
+            img = replay_op(img, ('adjust', ad))
+    else:
+        data, size, mode = src
+        img = Image.frombytes(mode, size, data)
+    img.save(dst)
+    return dst
 
 # ---------------------- Data Model ----------------------
+PROXY_MAX_SIDE = 1600  # longest side of the downsampled drag-preview image
+
+def _encode_pil(pil):
+    # lossless in-memory PNG; low compression level favours push latency
+    buf = BytesIO()
+    pil.save(buf, 'PNG', compress_level=1)
+    return buf.getvalue()
+
+def _decode_pil(data):
+    im = Image.open(BytesIO(data))
+    im.load()
+    return im
+
 class ImageDocument:
     def __init__(self, path=None, pil_image: Image.Image=None):
         self.path = path
         self.pil = pil_image.convert('RGB') if pil_image else None
-        self.history = []
+        self.pil_full = self.pil  # full-resolution original, untouched by edits
+        self._downsampled = False
+        self.ops = []         # one step (tuple of ops) per push, replayed at full res on export
+        self.rgba_np = None   # H×W×4 uint8 buffer shared with Qt (see np_to_qpixmap)
+        self._rgba_src = None  # the PIL image rgba_np currently mirrors
+        self._proxy = None    # downsampled copy of the baseline used while dragging
+        self.history = []      # PNG-encoded snapshots, not live images
+        self._baseline_pil = None  # decoded cache of history[-1]
         if self.pil:
-            self.history.append(self.pil.copy())
+            # big images are edited on a ~2K working copy; export composites
+            # the committed ops + adjustments on pil_full instead
+            if self.pil.width * self.pil.height > 4e6:
+                work = self.pil.copy()
+                work.thumbnail((2048, 2048), Image.LANCZOS)
+                self.pil = work
+                self._downsampled = True
+            self.history.append(_encode_pil(self.pil))
+            self._baseline_pil = self.pil.copy()
         self.adjustments = {
             'brightness': 0,    # -100..100
             'contrast': 0,      # -100..100
             'saturation': 0,    # -100..100
             'kelvin': 6500,     # 2000..10000
             'shadows': 0,       # -100..100
-            'highlights': 0     # -100..100
+            'highlights': 0,    # -100..100
+            'vignette': 0       # 0..100
         }
-    def push(self):
-        self.history.append(self.pil.copy())
+    def push(self, op=None):
+        self.history.append(_encode_pil(self.pil))
+        self._baseline_pil = self.pil.copy()
+        self._proxy = None
+        # one replay step per history entry. If the sliders were non-default
+        # when the operation ran, doc.pil had those adjustments rendered in,
+        # so bake them into the step ahead of the operation itself — and
+        # reset them, since they are now part of the new baseline and must
+        # not be applied (or replayed on export) a second time.
+        step = []
+        if self.has_adjustments():
+            step.append(('adjust', dict(self.adjustments)))
+            self.reset_adjustments()
+        if op is not None:
+            step.append(op)
+        self.ops.append(tuple(step))
     def undo(self):
         if len(self.history) > 1:
             self.history.pop()
-            self.pil = self.history[-1].copy()
+            if self.ops:
+                self.ops.pop()
+            self._baseline_pil = _decode_pil(self.history[-1])
+            self.pil = self._baseline_pil.copy()
+            self._proxy = None
             return True
         return False
+    def has_adjustments(self):
+        return _has_adjustments(self.adjustments)
+    def render_full(self):
+        # image to write on export: for downsampled documents, replay the
+        # committed steps and current adjustments on the full-res original
+        if not self._downsampled:
+            return self.pil
+        img = self.pil_full
+        for step in self.ops:
+            for op in step:
+                img = replay_op(img, op)
+        if self.has_adjustments():
+            img = replay_op(img, ('adjust', self.adjustments))
+        return img
+    def baseline(self):
+        # decoded view of history[-1]; only slider previews read this, so it
+        # is cached to avoid a PNG decode per slider tick
+        if self._baseline_pil is None:
+            self._baseline_pil = _decode_pil(self.history[-1])
+        return self._baseline_pil
+    def proxy(self):
+        base = self.baseline()
+        if max(base.size) <= PROXY_MAX_SIDE:
+            return base
+        if self._proxy is None:
+            w, h = base.size
+            scale = PROXY_MAX_SIDE / max(w, h)
+            self._proxy = base.resize((int(w*scale), int(h*scale)), Image.BILINEAR)
+        return self._proxy
+    def ensure_rgba(self, h, w):
+        if self.rgba_np is None or self.rgba_np.shape[:2] != (h, w):
+            self.rgba_np = np.empty((h, w, 4), dtype=np.uint8)
+            self.rgba_np[:, :, 3] = 255  # alpha written once
+        return self.rgba_np
+    def rgba(self):
+        # contiguous RGBA mirror of self.pil, refreshed only when pil changed
+        if self.pil is None:
+            return None
+        if self._rgba_src is not self.pil:
+            im = self.pil if self.pil.mode == 'RGB' else self.pil.convert('RGB')
+            buf = self.ensure_rgba(im.height, im.width)
+            buf[:, :, :3] = np.asarray(im)
+            self._rgba_src = self.pil
+        return self.rgba_np
     def reset_adjustments(self):
         self.adjustments = {k: (6500 if k=='kelvin' else 0) for k in self.adjustments}
 
@@ -126,17 +584,40 @@ class PhotoTab(QWidget):
         self.view.setRenderHint(QPainter.Antialiasing, True)
         self.view.setRenderHint(QPainter.SmoothPixmapTransform, True)
         layout.addWidget(self.view)
-        self.pix_item = None
+        # one pixmap item for the tab's lifetime; refresh only swaps pixmaps
+        self.pix_item = QGraphicsPixmapItem()
+        self.scene.addItem(self.pix_item)
+        self._last_size = None
         self.refresh()
 
     def refresh(self):
-        self.scene.clear()
         if self.doc and self.doc.pil:
-            pix = pil_to_qpixmap(self.doc.pil)
-            self.pix_item = QGraphicsPixmapItem(pix)
-            self.scene.addItem(self.pix_item)
+            pix = np_to_qpixmap(self.doc.rgba())
+            self.pix_item.setPixmap(pix)
+            self.scene.setSceneRect(self.pix_item.boundingRect())
+            # refit whenever the pixmap dimensions change (first load,
+            # rotate, proxy/full-res switches); same-size previews keep the
+            # user's view transform
+            size = (pix.width(), pix.height())
+            if size != self._last_size:
+                self.view.fitInView(self.pix_item, Qt.KeepAspectRatio)
+                self._last_size = size
+
+    def _refit(self):
+        if self._last_size is not None:
             self.view.fitInView(self.pix_item, Qt.KeepAspectRatio)
 
+    # add_tab fits against a not-yet-laid-out viewport, so the first fit uses
+    # a bogus size; refit whenever the viewport geometry actually settles
+    # (the view offers no zoom/pan of its own, so refitting is always safe)
+    def showEvent(self, event):
+        super().showEvent(event)
+        self._refit()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._refit()
+
 # ---------------------- Main Window ----------------------
 class PhotoEditorMain(QMainWindow):
     def __init__(self):
@@ -177,6 +658,21 @@ class PhotoEditorMain(QMainWindow):
         self.hist_label.setStyleSheet('border:1px solid #ddd; background:#fff')
         cp_layout.addWidget(self.hist_label)
 
+        # histogram figure built once; lines are updated in-place per preview
+        self.hist_fig = Figure(figsize=(4.0, 1.0), dpi=100, tight_layout=True)
+        self.hist_canvas = FigureCanvas(self.hist_fig)
+        self.hist_ax = self.hist_fig.add_subplot(111)
+        bins = np.arange(256)
+        zeros = np.zeros(256)
+        self.hist_lines = {
+            'lum': self.hist_ax.plot(bins, zeros, color='k', linewidth=1.2)[0],
+            'r': self.hist_ax.plot(bins, zeros, color='#c00', linewidth=0.8)[0],
+            'g': self.hist_ax.plot(bins, zeros, color='#0a0', linewidth=0.8)[0],
+            'b': self.hist_ax.plot(bins, zeros, color='#00c', linewidth=0.8)[0],
+        }
+        self.hist_ax.axis('off')
+        self._hist_buf = None  # keeps the RGBA buffer alive behind the QImage
+
         # sliders
         grid = QGridLayout()
         grid.setSpacing(6)
@@ -188,6 +684,8 @@ class PhotoEditorMain(QMainWindow):
             val_label = QLabel(str(init))
             s.valueChanged.connect(lambda v, t=title: self.on_slider(t, v))
             s.valueChanged.connect(lambda v, l=val_label: l.setText(str(v)))
+            # full-res preview once the user lets go of the handle
+            s.sliderReleased.connect(lambda: self._preview_timer.start(0))
             self.sliders[title] = s
             grid.addWidget(lab, row, 0)
             grid.addWidget(s, row, 1)
@@ -198,6 +696,7 @@ class PhotoEditorMain(QMainWindow):
         add_slider('Beyaz Dengesi (K)', 2000, 10000, 6500, 3)
         add_slider('Shadows', -100, 100, 0, 4)
         add_slider('Highlights', -100, 100, 0, 5)
+        add_slider('Vignette', 0, 100, 0, 6)
 
         cp_layout.addLayout(grid)
 
@@ -252,6 +751,17 @@ class PhotoEditorMain(QMainWindow):
 
         self.tabs_docs = []  # parallel to tabs: PhotoTab instances
 
+        # coalesce slider events: many valueChanged ticks, one preview
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.timeout.connect(self._do_preview)
+
+        # histogram runs on the global thread pool; stale results are
+        # discarded via a generation counter
+        self._hist_gen = 0
+        self._hist_signals = _HistSignals()
+        self._hist_signals.done.connect(self._on_hist_done)
+
     # ---------------------- Tab & Loading ----------------------
     def load_images(self):
         paths, _ = QFileDialog.getOpenFileNames(self, 'Resimleri Seç', os.getcwd(), 'Images (*.png *.jpg *.jpeg *.bmp *.webp)')
@@ -311,6 +821,28 @@ class PhotoEditorMain(QMainWindow):
         return t.doc if t else None
 
     # ---------------------- Controls sync ----------------------
+    def request_histogram(self, doc):
+        self._hist_gen += 1
+        QThreadPool.globalInstance().start(
+            HistWorker(self._hist_gen, doc.pil, self._hist_signals))
+
+    def _on_hist_done(self, generation, hist):
+        if generation != self._hist_gen:
+            return  # a newer request is already in flight
+        self.update_hist_pixmap(hist)
+
+    def update_hist_pixmap(self, hist):
+        for key, line in self.hist_lines.items():
+            line.set_ydata(hist[key])
+        self.hist_ax.relim()
+        self.hist_ax.autoscale_view(True, True, True)
+        self.hist_canvas.draw()
+        w_px, h_px = self.hist_canvas.get_width_height()
+        self._hist_buf = np.frombuffer(self.hist_canvas.buffer_rgba(), dtype=np.uint8).reshape((h_px, w_px, 4))
+        qimg = QImage(self._hist_buf.data, w_px, h_px, QImage.Format_RGBA8888)
+        pix = QPixmap.fromImage(qimg)
+        self.hist_label.setPixmap(pix.scaled(self.hist_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+
     def refresh_controls_for_current(self):
         doc = self.current_doc()
         if not doc:
@@ -322,7 +854,8 @@ class PhotoEditorMain(QMainWindow):
         # set sliders to doc.adjustments (block signals to avoid immediate preview)
         mapping = {
             'Parlaklık': 'brightness', 'Kontrast': 'contrast', 'Doygunluk': 'saturation',
-            'Beyaz Dengesi (K)': 'kelvin', 'Shadows': 'shadows', 'Highlights': 'highlights'
+            'Beyaz Dengesi (K)': 'kelvin', 'Shadows': 'shadows', 'Highlights': 'highlights',
+            'Vignette': 'vignette'
         }
         for slider_name, key in mapping.items():
             s = self.sliders[slider_name]
@@ -333,9 +866,7 @@ class PhotoEditorMain(QMainWindow):
         t = self.current_tab()
         if t:
             t.refresh()
-            hist = compute_histogram(doc.pil)
-            pix = histogram_pixmap(hist, w=400, h=100)
-            self.hist_label.setPixmap(pix.scaled(self.hist_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+            self.request_histogram(doc)
 
     def on_slider(self, name, value):
         doc = self.current_doc()
@@ -343,121 +874,64 @@ class PhotoEditorMain(QMainWindow):
             return
         mapping = {
             'Parlaklık': 'brightness', 'Kontrast': 'contrast', 'Doygunluk': 'saturation',
-            'Beyaz Dengesi (K)': 'kelvin', 'Shadows': 'shadows', 'Highlights': 'highlights'
+            'Beyaz Dengesi (K)': 'kelvin', 'Shadows': 'shadows', 'Highlights': 'highlights',
+            'Vignette': 'vignette'
         }
         if name not in mapping:
             return
         key = mapping[name]
         doc.adjustments[key] = value
-        self.apply_adjustments_preview()
+        self._preview_timer.start(30)
 
-    def apply_adjustments_preview(self):
+    def _do_preview(self):
+        # while a handle is held down, render against the cheap proxy
+        dragging = any(s.isSliderDown() for s in self.sliders.values())
+        self.apply_adjustments_preview(full_res=not dragging)
+
+    def apply_adjustments_preview(self, full_res=True):
         doc = self.current_doc()
         if not doc:
             return
-        base = doc.history[-1]
-        ad = doc.adjustments
-        arr = np.array(base).astype(np.float32)
-        # white balance
-        gains = kelvin_to_rgb_gains(ad['kelvin'])
-        arr[:,:,0] = np.clip(arr[:,:,0] * gains[0], 0, 255)
-        arr[:,:,1] = np.clip(arr[:,:,1] * gains[1], 0, 255)
-        arr[:,:,2] = np.clip(arr[:,:,2] * gains[2], 0, 255)
-        # brightness
-        arr = np.clip(arr + ad['brightness'], 0, 255)
-        # contrast
-        c = 1 + (ad['contrast'] / 100.0)
-        arr = np.clip((arr - 128) * c + 128, 0, 255)
-        # saturation
-        if ad['saturation'] != 0:
-            s = ad['saturation'] / 100.0
-            lum = (0.2126*arr[:,:,0] + 0.7152*arr[:,:,1] + 0.0722*arr[:,:,2])[:,:,None]
-            arr = np.clip(lum + (arr - lum) * (1 + s), 0, 255)
-        # shadows/highlights approx
-        def tone_pixel(a, shadows, highlights):
-            t = a/255.0
-            s = shadows/100.0
-            h = highlights/100.0
-            if s != 0:
-                lift = s*0.6
-                w = np.minimum(1.0, np.maximum(0.0, (t - 0.0)/(0.6-0.0)))
-                t = t + (lift*(1-w))*(1-t)
-            if h != 0:
-                comp = h*0.6
-                w2 = np.minimum(1.0, np.maximum(0.0, (t - 0.4)/(1.0-0.4)))
-                t = t - (comp * w2) * t
-            return np.clip(t*255.0, 0, 255)
-        if ad['shadows'] != 0 or ad['highlights'] != 0:
-            arr = tone_pixel(arr, ad['shadows'], ad['highlights'])
-        img2 = Image.fromarray(arr.astype(np.uint8))
+        base = doc.baseline() if full_res else doc.proxy()
+        src = np.asarray(base.convert('RGB'))
+        rgba = doc.ensure_rgba(src.shape[0], src.shape[1])
+        # render straight into the Qt-shared buffer, skipping the PIL round-trip
+        apply_adjustments(src, doc.adjustments, rgba[:, :, :3])
+        img2 = Image.fromarray(rgba[:, :, :3])
+        doc._rgba_src = img2  # rgba_np already holds this preview
         # set doc.pil to preview but do not push history
         doc.pil = img2
         # refresh current tab view & histogram
         t = self.current_tab()
         if t:
             t.refresh()
-            hist = compute_histogram(doc.pil)
-            pix = histogram_pixmap(hist, w=400, h=100)
-            self.hist_label.setPixmap(pix.scaled(self.hist_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+            self.request_histogram(doc)
 
     # ---------------------- Effects (applied and pushed) ----------------------
     def apply_effect(self, effect):
         doc = self.current_doc()
         if not doc:
             return
-        img = doc.pil.copy()
-        if effect == 'sharpen':
-            img = img.filter(ImageFilter.UnsharpMask(radius=1, percent=120, threshold=3))
-        elif effect == 'orange':
-            r, g, b = img.split()
-            r = r.point(lambda v: min(255, v+12))
-            g = g.point(lambda v: min(255, v+6))
-            img = Image.merge('RGB', (r,g,b))
-        elif effect == 'red':
-            r, g, b = img.split()
-            r = r.point(lambda v: min(255, v+18))
-            img = Image.merge('RGB', (r,g,b))
-        elif effect == 'blue':
-            r, g, b = img.split()
-            b = b.point(lambda v: min(255, v+18))
-            img = Image.merge('RGB', (r,g,b))
-        elif effect == 'brighten':
-            img = ImageEnhance.Brightness(img).enhance(1.15)
-        elif effect == 'clarity':
-            img = ImageEnhance.Sharpness(img).enhance(1.2)
-        elif effect == 'vignette':
-            w, h = img.size
-            xv, yv = np.meshgrid(np.linspace(-1,1,w), np.linspace(-1,1,h))
-            dist = np.sqrt(xv**2 + yv**2)
-            mask = np.clip(1 - (dist/np.sqrt(2)), 0, 1)
-            mask = (0.6 + 0.4*mask)[:,:,None]
-            arr = np.array(img).astype(np.float32)
-            arr = arr * mask
-            img = Image.fromarray(arr.astype(np.uint8))
-        elif effect == 'noise':
-            a = np.array(img)
-            a = cv2.bilateralFilter(a, d=5, sigmaColor=75, sigmaSpace=75)
-            img = Image.fromarray(a)
-        else:
+        img = apply_effect_image(doc.pil.copy(), effect)
+        if img is None:
             return
         doc.pil = img
-        doc.push()
-        # when effect applied, reset adjustments baseline to current image
-        doc.reset_adjustments()
+        # push bakes and resets any live adjustments into the new baseline
+        doc.push(op=('effect', effect))
         self.refresh_controls_for_current()
 
     def rotate90(self):
         doc = self.current_doc()
         if not doc: return
         doc.pil = doc.pil.rotate(-90, expand=True)
-        doc.push()
+        doc.push(op=('rotate90',))
         self.refresh_controls_for_current()
 
     def flip_horizontal(self):
         doc = self.current_doc()
         if not doc: return
         doc.pil = ImageOps.mirror(doc.pil)
-        doc.push()
+        doc.push(op=('flip_h',))
         self.refresh_controls_for_current()
 
     def undo(self):
@@ -471,47 +945,23 @@ class PhotoEditorMain(QMainWindow):
     def portrait_mode(self):
         doc = self.current_doc()
         if not doc: return
-        img = doc.pil.copy()
-        a = np.array(img)
-        gray = cv2.cvtColor(a, cv2.COLOR_RGB2GRAY)
-        faces = []
-        try:
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-        except Exception:
-            faces = []
-        arr = a.astype(np.float32)
-        arr[:,:,0] *= 0.95
-        arr[:,:,1] = np.minimum(255, arr[:,:,1]*1.05)
-        arr[:,:,2] = np.minimum(255, arr[:,:,2]*1.05)
-        a = arr.astype(np.uint8)
-        if len(faces) > 0:
-            for (x,y,w,h) in faces:
-                roi = a[y:y+h, x:x+w]
-                blurred = cv2.bilateralFilter(roi, d=9, sigmaColor=75, sigmaSpace=75)
-                a[y:y+h, x:x+w] = cv2.addWeighted(roi, 0.6, blurred, 0.4, 0)
-        else:
-            a = cv2.bilateralFilter(a, d=9, sigmaColor=75, sigmaSpace=75)
-        img2 = Image.fromarray(a)
-        doc.pil = img2
-        doc.push()
+        doc.pil = portrait_image(doc.pil.copy())
+        doc.push(op=('portrait',))
         self.refresh_controls_for_current()
 
     def auto_enhance(self):
         doc = self.current_doc()
         if not doc: return
-        img = ImageEnhance.Contrast(doc.pil).enhance(1.08)
-        img = ImageEnhance.Brightness(img).enhance(1.06)
-        doc.pil = img
-        doc.push()
+        doc.pil = auto_enhance_image(doc.pil)
+        doc.push(op=('auto',))
         self.refresh_controls_for_current()
 
     def reset_adjustments(self):
         doc = self.current_doc()
         if not doc: return
         doc.reset_adjustments()
-        # preview should use baseline history[-1]
-        doc.pil = doc.history[-1].copy()
+        # preview should use the history baseline
+        doc.pil = doc.baseline().copy()
         self.refresh_controls_for_current()
 
     # ---------------------- Export ----------------------
@@ -522,7 +972,7 @@ class PhotoEditorMain(QMainWindow):
             return
         p = QFileDialog.getSaveFileName(self, 'Dışa Aktar', doc.path or os.getcwd(), 'PNG (*.png);;JPEG (*.jpg *.jpeg)')
         if p and p[0]:
-            doc.pil.save(p[0])
+            doc.render_full().save(p[0])
             QMessageBox.information(self, 'Başarılı', 'Görsel kaydedildi.')
 
     def bulk_export(self):
@@ -532,12 +982,38 @@ class PhotoEditorMain(QMainWindow):
         folder = QFileDialog.getExistingDirectory(self, 'Klasör seç (Toplu Dışa Aktar)')
         if not folder:
             return
+        jobs = []
         for i, tab in enumerate(list(self.tabs_docs)):
             doc = tab.doc
             name = doc.path and os.path.basename(doc.path) or f'resim_{i+1}.png'
             dst = os.path.join(folder, f'processed_{i+1}_{name}')
-            doc.pil.save(dst)
-        QMessageBox.information(self, 'Bitti', f'{len(self.tabs_docs)} resim kaydedildi.')
+            if doc._downsampled and doc.path:
+                # hand the worker the file path; the full-res replay happens
+                # in the worker, not here
+                jobs.append((doc.path, list(doc.ops), dict(doc.adjustments), dst))
+            else:
+                img = doc.render_full()
+                jobs.append(((img.tobytes(), img.size, img.mode), None, None, dst))
+        progress = QProgressDialog('Dışa aktarılıyor...', None, 0, len(jobs), self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setValue(0)
+        # images are independent: encode and write them across all cores.
+        # spawn, not fork: Numba's threading layer (initialized by the eager
+        # parallel kernel) and the live Qt process are not fork-safe
+        with ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                 mp_context=multiprocessing.get_context('spawn')) as ex:
+            futures = [ex.submit(_export_one, job) for job in jobs]
+            for done, fut in enumerate(as_completed(futures), start=1):
+                fut.result()
+                progress.setValue(done)
+        QMessageBox.information(self, 'Bitti', f'{len(jobs)} resim kaydedildi.')
+
+    # ---------------------- Shutdown ----------------------
+    def closeEvent(self, event):
+        # in-flight histogram workers emit on _HistSignals, which dies with
+        # this window; drain the pool so no worker emits into a dead object
+        QThreadPool.globalInstance().waitForDone()
+        super().closeEvent(event)
 
 # ---------------------- Run ----------------------
 if __name__ == '__main__':